@@ -0,0 +1,70 @@
+"""
+@aim: Implements a class that groups agents of the same type to decide their steps all at once
+@authors: Ivan-Daniel Sievering
+@date: 2022/01/31
+"""
+
+# --- Libraries, constants and parameters --- #
+# Libraries
+import numpy as np
+
+
+# --- Class definition --- #
+class AgentPool:
+    """
+    @aim: implements the pool of agents of one type, their decisions on a batch of steps are computed together by the
+          pool_batch_kernel of their class, only the agents that have to act are then called one by one
+    @functions: - __init__ : initialise the pool
+                - add_agent : add an agent (already linked to the simulation) in the pool
+                - step_batch : does a batch of steps for all the agents of the pool
+    @parameters:- agent_l : list of the agents of the pool
+                - kernel : function deciding which agents act on which steps (pool_batch_kernel of the class of the
+                           agents)
+                - crypto_rows : array with the index of the crypto considered by each agent
+                - thresholds : array with the threshold of each agent
+                - ref_prices : array with the reference price of each agent (to compare with the current price)
+    """
+
+    def __init__(self, kernel):
+        """
+        @aim: initialise the pool
+        @input: - kernel : function (crypto_rows, thresholds, ref_prices, prices_block, valid) -> index of the agent
+                           and of the step of each action (in the order of the steps)
+        """
+
+        self.agent_l = []
+        self.kernel = kernel
+        self.crypto_rows = np.zeros(0, dtype=np.int64)
+        self.thresholds = np.zeros(0, dtype=np.float64)
+        self.ref_prices = np.zeros(0, dtype=np.float64)
+
+    def add_agent(self, agent):
+        """
+        @aim: add an agent in the pool (has to be linked to the simulation to have its parameters)
+        @input: - agent : agent object with a pool_batch_kernel and the pool_params and pool_act functions
+        """
+
+        crypto_row, threshold, ref_price = agent.pool_params()
+        self.agent_l.append(agent)
+        self.crypto_rows = np.append(self.crypto_rows, crypto_row)
+        self.thresholds = np.append(self.thresholds, threshold)
+        self.ref_prices = np.append(self.ref_prices, ref_price)
+
+    def step_batch(self, t_start, t_end, prices_block, valid):
+        """
+        @aim: decides for all the agents at once on which steps of the batch they act (one pass on the prices), then
+              makes them act on these steps, in the order of the steps (the decision of the kernel is applied as is,
+              the agents do not decide again)
+        @input: - t_start : index of the first step of the batch in the simulation
+                - t_end : index of the step after the last one of the batch
+                - prices_block : price of each crypto on each step of the batch (n_crypto, t_end - t_start)
+                - valid : bool array, True on the steps of the batch where all the prices are available
+        """
+
+        # the kernel compares in the dtype of the prices as the agents do (and updates its copy of the references)
+        agent_pos_l, step_l = self.kernel(self.crypto_rows, self.thresholds.astype(prices_block.dtype),
+                                          self.ref_prices.astype(prices_block.dtype), prices_block, valid)
+        for i, k in zip(agent_pos_l, step_l):
+            self.agent_l[i].pool_act(prices_block[self.crypto_rows[i], k], t_start + k)
+        for i in np.unique(agent_pos_l):
+            self.ref_prices[i] = self.agent_l[i].pool_params()[2]
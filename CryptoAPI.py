@@ -4,52 +4,98 @@
 @date: 2022/01/31
 """
 
+# --- Libraries, constants and parameters --- #
+# Libraries
+import logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
 
 # --- Class definition --- #
 class CryptoAPI:
     """
     @aim: implements the crypto API class (to sell/buy crypto)
     @functions: - __init__ : initialise the API
+                - set_imposition_rate : change the imposition rate (and rebuild the effective prices)
+                - get_buy_price : get the price to pay for one crypto (taxes included)
+                - get_sell_value : get the money earned for one crypto (taxes included)
                 - buy_crypto_from_api : buy a certain amount of crypto from the API
                 - sell_crypto_to_api: sell a certain amount of crypto to the API
-    @parameters:- market : market object from the simulation (to get the value of the crypto)
-                - imposition_rate : percentage of money kept by the API
+    @parameters:- simulation : simulation to which belongs the API (to get the step and the market)
+                - imposition_perc : percentage of money kept after the taxes of the API
+                - buy_price : array (n_crypto, n_steps) with the price (taxes included) on each step of the market
+                - sell_value : array (n_crypto, n_steps) with the value (taxes included) on each step of the market
     """
 
     def __init__(self, simulation, imposition_rate=0.01):
         """
         @aim: initialise the API
-        @input: - simulation : simulation to which belongs the API (to get the date and the market)
+        @input: - simulation : simulation to which belongs the API (to get the step and the market)
                 - imposition_rate : imposition rate of the API
         """
 
         self.simulation = simulation
+        self.set_imposition_rate(imposition_rate)
+        logger.info("API created!")
+
+    def set_imposition_rate(self, imposition_rate):
+        """
+        @aim: set the imposition rate and precompute the effective prices (taxes included) of each crypto
+        @input: - imposition_rate : imposition rate of the API
+        """
+
+        # the market stores float32 prices, but money is always computed in float64
         self.imposition_perc = 1 - imposition_rate
-        print("API created!")
+        prices = self.simulation.market.prices.astype(np.float64)
+        self.buy_price = prices / self.imposition_perc
+        self.sell_value = prices * self.imposition_perc
+
+    def get_buy_price(self, crypto_name, t_idx=None):
+        """
+        @aim: get the price to pay for one crypto (taxes included)
+        @input: - crypto_name : name of the crypto
+                - t_idx : index of the step in the market (if None, the current step of the simulation is used)
+        @output: price of one crypto
+        """
+
+        if t_idx is None:
+            t_idx = self.simulation.t_idx
+        return self.buy_price[self.simulation.crypto_idx[crypto_name], t_idx]
+
+    def get_sell_value(self, crypto_name, t_idx=None):
+        """
+        @aim: get the money earned for one crypto (taxes included)
+        @input: - crypto_name : name of the crypto
+                - t_idx : index of the step in the market (if None, the current step of the simulation is used)
+        @output: money earned for one crypto
+        """
+
+        if t_idx is None:
+            t_idx = self.simulation.t_idx
+        return self.sell_value[self.simulation.crypto_idx[crypto_name], t_idx]
 
-    def buy_crypto_from_api(self, money, crypto_name):
+    def buy_crypto_from_api(self, money, crypto_name, t_idx=None):
         """
         @aim: buy for a certain amount of money crypto
         @input: - money : for how much money buy
                 - crypto_name : name of the crypto that we want to buy
+                - t_idx : index of the step in the market (if None, the current step of the simulation is used)
         @output:  quantity of crypto that we get
         """
 
-        money *= self.imposition_perc
-        crypto_qte = money / self.simulation.market.get_price(crypto_name, self.simulation.current_date)
-        return crypto_qte
+        return money / self.get_buy_price(crypto_name, t_idx)
 
-    def sell_crypto_to_api(self, crypto_qte, crypto_name):
+    def sell_crypto_to_api(self, crypto_qte, crypto_name, t_idx=None):
         """
         @aim: sell a certain amount of crypto for money
         @input: - crypto_qte : quantity of crypto that we want to sell
                 - crypto_name : name of the crypto that we want to sell
+                - t_idx : index of the step in the market (if None, the current step of the simulation is used)
         @output:  money that we get back
         """
 
-        money = crypto_qte * self.simulation.market.get_price(crypto_name, self.simulation.current_date)
-        money *= self.imposition_perc
-        return money
+        return crypto_qte * self.get_sell_value(crypto_name, t_idx)
 
 
 # --- Main (just to test and see how it works) --- #
@@ -65,12 +111,13 @@ if __name__ == "__main__":
 
     # Create a fake simulation class just for the example
     class Simulation:
-        def __init__(self, market, current_date):
+        def __init__(self, market, t_idx):
             self.market = market
-            self.current_date = current_date
+            self.crypto_idx = market.crypto_idx
+            self.t_idx = t_idx
 
-    # Init the simulation
-    simulation_test = Simulation(market_test, request_date_test)
+    # Init the simulation (on the step of the request date)
+    simulation_test = Simulation(market_test, int((request_date_test - init_date_test).total_seconds() // 60))
 
     # Init the API
     api = CryptoAPI(simulation_test, imposition_rate=0.01)
@@ -8,31 +8,130 @@
 # Libraries
 import sys
 from abc import ABC, abstractmethod
+from enum import IntEnum
+import numpy as np
+import pandas as pd
+from crypto_api_numba import apply_buy, apply_sell
+
+# Constants
+STATE_CAPACITY = 64  # nb of states allocated at first in the history of an agent (doubled when full)
+REPARTITION_TOL = 1e-9  # rounding error allowed on the sum of an initial repartition (0.56 + 0.28 + 0.16 > 1)
+
+
+# --- Functions definition --- #
+def init_spend(agent_name, init_money, init_repartition, crypto_name_l):
+    """
+    @aim: get the money that the initial buy spends in each crypto (shared by buy_init_cryptos and the sweeps)
+    @input: - agent_name : name of the agent (for the error)
+            - init_money : money that the agent has at the beginning
+            - init_repartition : dict of initial repartition of the money along cryptos (a missing crypto is not bought)
+            - crypto_name_l : names of the cryptos, in the order of the holdings
+    @output: array with the money spent in each crypto, money left to the agent
+    """
+
+    repartition = np.array([init_repartition.get(crypto_name, 0.0) for crypto_name in crypto_name_l])
+    if repartition.sum() > 1 + REPARTITION_TOL:
+        raise InsufficientFundsError(agent_name, init_money * repartition.sum(), init_money)
+    spend = init_money * repartition
+    return spend, max(init_money - spend.sum(), 0.0)  # rounding may spend a bit more than the money
 
 
 # --- Class definition --- #
+class ActionCode(IntEnum):
+    """
+    @aim: code of the action of a state of an agent (saved as int8 in its states)
+    """
+
+    NONE = 0
+    START = 1
+    END = 2
+    BUY = 3
+    SELL = 4
+    BOTH = 5  # sold and bought on the same step (only set when the states are evaluated)
+
+
+ACTION_TYPE_L = [action_code.name.lower() for action_code in ActionCode]  # name of each code (for the dfs)
+
+
+class InsufficientFundsError(Exception):
+    """
+    @aim: error raised when an agent tries to buy/sell more than it has
+    @parameters:- agent_name : name of the agent
+                - requested : quantity that the agent tried to use
+                - available : quantity that the agent has
+                - asset : what the agent tried to use ("money" or the name of the crypto)
+    """
+
+    def __init__(self, agent_name, requested, available, asset="money"):
+        """
+        @aim: initialise the error
+        @input: - agent_name : name of the agent
+                - requested : quantity that the agent tried to use
+                - available : quantity that the agent has
+                - asset : what the agent tried to use ("money" or the name of the crypto)
+        """
+
+        self.agent_name = agent_name
+        self.requested = requested
+        self.available = available
+        self.asset = asset
+        super().__init__("Agent {} is trying to use {} {} but only has {}.".format(agent_name, requested, asset,
+                                                                                   available))
+
+
 class CryptoAgent(ABC):
     """
     @aim: implements the CryptoAgent class (template to create agent that will buy/sell crypto)
     @functions: - __init__ : initialise the agent
                 - link_to_simulation : link the agent to the simulation
+                - buy_init_cryptos : buy the initial cryptos (all at once, can be overridden to use buy one by one)
                 - step : decision of the agent on one step (i.e. 1 minute)
+                - vector_step : decision of the agent on one step, given the prices of all the cryptos at this step
+                - step_batch : (optional) decision of the agent on a batch of consecutive steps at once
                 - buy : action for the agent to buy crypto
                 - sell : action for the agent to sell crypto
                 - load_init_info : to add information before launching the simulation (for example, previous values)
                 - add_state : save the state at a specific point
+                - state_df : get the saved states as a df
+                - history_df : get the money and the qte of each crypto at each step of the simulation as a df
+                - available_crypto_l : dict with the qte of each crypto that the agent has (read only copy)
     @parameters:- name : name of the agent (str)
-                - available_crypto_l : dict with the qte of each crypto that the agent has
+                - holdings : array with the qte of each crypto that the agent has
+                - crypto_idx : dict giving the index of each crypto in the holdings (shared table once linked)
+                - _crypto_names : tuple of the names of the cryptos, in the order of the holdings (set when linked)
+                - _primary_crypto_idx : index of the crypto used by default by the agent (the last one)
+                  -> resolve names/indexes once (link_to_simulation/load_init_info) and reuse them in the step,
+                     never rebuild lists of the keys (or the available_crypto_l dict) at each step
                 - available_money : money that the agent has
                 - earned_money : money that the agent has earned (will never be used again)
                 - init_money : money that the agent has at the beginning
-                - init_repartition : initial repartition of the money along cryptos
+                - init_repartition : initial repartition of the initial money along cryptos
                                     [0.75, 0.1] means 75% in the first crypto, 10% in the second and 15% still in money
                 - simulation : ref to the current simulation (to get prices, api, ...)
-                - state_hist : history of the states of the agent during the simulation
+                - _idx : index of the agent in the simulation (set when added, row of the agent in its arrays)
+                - state_col_l : dict of arrays with the states of the agent during the simulation, one column per
+                                value (t_idx, total_value, available_money, earned_money,
+                                available_cryptos (n, n_crypto), action_type (ActionCode),
+                                action_crypto (bool (n, n_crypto)))
+                - state_detail_l : detail of the action of each state (text)
+                - n_states : nb of states saved (the columns are allocated in advance, only the first n are valid)
+                - pool_batch_kernel : (class attribute) kernel deciding at once on a batch of steps for a pool of
+                                      agents of this class (None if the agents of this class cannot be grouped in a
+                                      pool, see AgentPool.py, needs a step_batch to act on the steps)
+                - needs_step : (class attribute) False if the step does nothing (the simulation does not call it)
+                - step_batch : method (t_start, t_end, prices_block, valid) deciding on a batch of steps at once, None
+                               if the agent decides step by step (the simulation then calls vector_step at each step)
+                - sweep : (class method) (simulation, init_money, init_repartition, **param_grid) simulating at once
+                          agents of this class that only differ by their parameters, None if the class cannot (see
+                          CryptoSimulation.simulate_batch)
 
     """
 
+    pool_batch_kernel = None
+    needs_step = True
+    step_batch = None
+    sweep = None
+
     def __init__(self, name, crypto_name_l, init_money, init_repartition):
         """
         @aim: initialise the agent
@@ -45,15 +144,28 @@ class CryptoAgent(ABC):
 
         self.name = name
 
-        self.available_crypto_l = dict(zip(crypto_name_l, [0] * len(crypto_name_l)))
+        self.holdings = np.zeros(len(crypto_name_l), dtype=np.float64)
+        self.crypto_idx = {crypto_name: i for i, crypto_name in enumerate(crypto_name_l)}
         self.available_money = init_money
         self.earned_money = 0
         self.init_money = init_money
         self.init_repartition = init_repartition
 
         self.simulation = None
+        self._idx = None
+
+        self.state_col_l = None
+        self.state_detail_l = []
+        self.n_states = 0
+
+    @property
+    def available_crypto_l(self):
+        """
+        @aim: get the qte of each crypto that the agent has as a dict (copy, modifying it does not change the agent)
+        @output: dict with the qte of each crypto that the agent has
+        """
 
-        self.state_hist = []
+        return dict(zip(self.crypto_idx, self.holdings))
 
     def link_to_simulation(self, simulation):
         """
@@ -61,14 +173,43 @@ class CryptoAgent(ABC):
         @input: - simulation : the simulation class that host the agent
         """
 
-        # Create links
+        # Create links (the index table of the cryptos is shared by all the agents of the simulation)
         self.simulation = simulation
+        self.crypto_idx = simulation.crypto_idx
+        self.holdings = np.zeros(len(self.crypto_idx), dtype=np.float64)
+        self._crypto_names = tuple(self.crypto_idx)
+        self._primary_crypto_idx = len(self._crypto_names) - 1
+        self.state_col_l = {
+            "t_idx": np.empty(STATE_CAPACITY, dtype=np.int64),
+            "total_value": np.empty(STATE_CAPACITY, dtype=np.float64),
+            "available_money": np.empty(STATE_CAPACITY, dtype=np.float64),
+            "earned_money": np.empty(STATE_CAPACITY, dtype=np.float64),
+            "available_cryptos": np.empty((STATE_CAPACITY, len(self._crypto_names)), dtype=np.float64),
+            "action_type": np.empty(STATE_CAPACITY, dtype=np.int8),
+            "action_crypto": np.empty((STATE_CAPACITY, len(self._crypto_names)), dtype=np.bool_),
+        }
+
+        self.buy_init_cryptos()
+        self.load_init_info()
 
-        # Buy initial crypto
-        for crypto_name in self.available_crypto_l.keys():
-            self.buy(self.available_money * self.init_repartition[crypto_name], crypto_name)
+    def buy_init_cryptos(self):
+        """
+        @aim: buy the initial cryptos, all in one shot (each crypto takes its part of the initial money)
+              (an agent needing specific logic can override it and call buy for each crypto)
+        """
 
-        self.load_init_info()
+        spend, money_left = init_spend(self.name, self.available_money, self.init_repartition, self._crypto_names)
+
+        bought_mask = spend > 0
+        if bought_mask.any():
+            buy_prices = self.simulation.api.buy_price[:, self.simulation.t_idx]
+            np.divide(spend, buy_prices, out=self.holdings, where=bought_mask)
+            self.available_money = money_left
+            # Save the action (one state for all the cryptos bought)
+            bought_idx = np.flatnonzero(bought_mask)
+            action_detail = "; ".join("Bought: {} {} for {}".format(self.holdings[i], self._crypto_names[i], spend[i])
+                                      for i in bought_idx)
+            self.add_state(ActionCode.BUY, bought_idx, action_detail)
 
     @abstractmethod
     def step(self):
@@ -79,45 +220,55 @@ class CryptoAgent(ABC):
         print("Agent step has to be implemented.")
         sys.exit()
 
-    def buy(self, money, crypto_name):
+    def vector_step(self, t_idx, prices_row):
+        """
+        @aim: implements the decision on a specific step when the simulation already gathered the prices
+              (to override if the agent can use them directly, by default calls step)
+        @input: - t_idx : index of the step in the simulation
+                - prices_row : price of each crypto of the simulation at this step (same order as crypto_name_l)
+        """
+
+        self.step()
+
+    def buy(self, money, crypto_name, t_idx=None):
         """
         @aim: buy for a certain amount of crypto (deal with removing money and adding crypto)
         @input: - money : quantity of money to invest
                 - crypto_name : name of the crypto
+                - t_idx : index of the step of the transaction (None for the current step of the simulation)
         """
 
-        # Check that it as money to do so
+        # Check that it as money to do so (the kernel clamps anyway, the error is for the caller)
         if money <= self.available_money:
             # Buy crypto to API and modify intern variables
-            crypto_qte = self.simulation.api.buy_crypto_from_api(money, crypto_name)
-            self.available_money -= money
-            self.available_crypto_l[crypto_name] += crypto_qte
+            idx = self.crypto_idx[crypto_name]
+            buy_price = self.simulation.api.buy_price[idx, self._step_idx(t_idx)]
+            self.available_money, crypto_qte = apply_buy(self.holdings, self.available_money, idx, money, buy_price)
             # Save the action
             action_detail = "Bought: {} {} for {}".format(crypto_qte, crypto_name, money)
-            self.add_state(self.simulation.current_date, "buy", crypto_name, action_detail)
+            self.add_state(ActionCode.BUY, idx, action_detail, t_idx)
         else:
-            print("Agent {} is trying to buy more than it has money.".format(self.name))
-            sys.exit()
+            raise InsufficientFundsError(self.name, money, self.available_money)
 
-    def sell(self, crypto_qte, crypto_name):
+    def sell(self, crypto_qte, crypto_name, t_idx=None):
         """
         @aim: sell for a certain amount of crypto (deal with adding money and removing crypto)
         @input: - crypto_qte : quantity of crypto to sell
                 - crypto_name : name of the crypto
+                - t_idx : index of the step of the transaction (None for the current step of the simulation)
         """
 
-        # Check that it has crypto to do so
-        if crypto_qte <= self.available_crypto_l[crypto_name]:
+        # Check that it has crypto to do so (the kernel clamps anyway, the error is for the caller)
+        idx = self.crypto_idx[crypto_name]
+        if crypto_qte <= self.holdings[idx]:
             # Sell crypto to API and modify intern variables
-            money = self.simulation.api.sell_crypto_to_api(crypto_qte, crypto_name)
-            self.available_crypto_l[crypto_name] -= crypto_qte
-            self.available_money += money
+            sell_value = self.simulation.api.sell_value[idx, self._step_idx(t_idx)]
+            self.available_money, money = apply_sell(self.holdings, self.available_money, idx, crypto_qte, sell_value)
             # Save the action
             action_detail = "Sell: {} {} for {}".format(crypto_qte, crypto_name, money)
-            self.add_state(self.simulation.current_date, "sell", crypto_name, action_detail)
+            self.add_state(ActionCode.SELL, idx, action_detail, t_idx)
         else:
-            print("Agent {} is trying to sell more than it has {}.".format(self.name, crypto_name))
-            sys.exit()
+            raise InsufficientFundsError(self.name, crypto_qte, self.holdings[idx], crypto_name)
 
     @abstractmethod
     def load_init_info(self):
@@ -127,38 +278,109 @@ class CryptoAgent(ABC):
 
         print("No specific initialisation needed.")
 
-    def add_state(self, date, action_type, action_crypto, action_detail):
+    def add_state(self, action_type, action_crypto, action_detail, t_idx=None):
         """
         Add a state to the record
-        :param date: date at which the event happened
-        :param action_type: what the agent did ("selL"/"buy"/"start"/"end")
-        :param action_crypto: on which crypto the action took place
+        :param action_type: what the agent did (ActionCode.SELL/BUY/START/END)
+        :param action_crypto: index (or list of indexes) of the cryptos on which the action took place (None if none)
         :param action_detail: how much sold/bought
+        :param t_idx: index of the step of the event (None for the current step of the simulation)
         """
 
-        # Compute the value of the crypto at this point (call api)
-        money_from_cryptos = 0
-        for crypto_name, crypto_qte in self.available_crypto_l.items():
-            money_from_cryptos += self.simulation.api.sell_crypto_to_api(crypto_qte, crypto_name)
+        # Compute the value of the crypto at this point (value given by the api)
+        t_idx = self._step_idx(t_idx)
+        money_from_cryptos = np.nansum(self.holdings * self.simulation.api.sell_value[:, t_idx])
 
         # Compute total value of the agent
         total_value = self.available_money + self.earned_money + money_from_cryptos
 
-        self.state_hist.append({
-                                    "date": date,
-                                    "total_value": total_value,
-                                    "available_money": self.available_money,
-                                    "earned_money": self.earned_money,
-                                    "available_cryptos": dict(self.available_crypto_l),  # do not take the pointer
-                                    "action_type": action_type,
-                                    "action_crypto": action_crypto,
-                                    "action_detail": action_detail
-                                })
+        # Write it in the columns (more space if full)
+        if self.n_states == len(self.state_col_l["t_idx"]):
+            self._grow_states()
+        i = self.n_states
+        self.state_col_l["t_idx"][i] = t_idx
+        self.state_col_l["total_value"][i] = total_value
+        self.state_col_l["available_money"][i] = self.available_money
+        self.state_col_l["earned_money"][i] = self.earned_money
+        self.state_col_l["available_cryptos"][i] = self.holdings
+        self.state_col_l["action_type"][i] = action_type
+        self.state_col_l["action_crypto"][i] = False
+        if action_crypto is not None:
+            self.state_col_l["action_crypto"][i, action_crypto] = True
+        self.state_detail_l.append(action_detail)
+        self.n_states += 1
+
+    def _grow_states(self):
+        """
+        @aim: double the space of the state columns (keeps the states already saved)
+        """
+
+        for col_name, col in self.state_col_l.items():
+            new_col = np.empty((2 * len(col),) + col.shape[1:], dtype=col.dtype)
+            new_col[:len(col)] = col
+            self.state_col_l[col_name] = new_col
+
+    def state_df(self, state_idx=None):
+        """
+        @aim: get the states saved during the simulation as a df (one row per state)
+        @input: - state_idx : array with the index of the states to take (None for all the states)
+        @output: dataframe indexed by the index of the states, with the date, the values, the qte of each crypto (one
+                 column per crypto) and the action of each state
+        """
+
+        if state_idx is None:
+            state_idx = np.arange(self.n_states)
+        col_l = self.state_col_l
+        cryptos = col_l["available_cryptos"][state_idx]
+        state_df = pd.DataFrame({
+                                    "date": self.simulation.date_grid[col_l["t_idx"][state_idx]],
+                                    "total_value": col_l["total_value"][state_idx],
+                                    "available_money": col_l["available_money"][state_idx],
+                                    "earned_money": col_l["earned_money"][state_idx],
+                                    **{crypto_name: cryptos[:, j] for j, crypto_name in enumerate(self._crypto_names)},
+                                    "action_type": pd.Categorical.from_codes(col_l["action_type"][state_idx],
+                                                                             ACTION_TYPE_L),
+                                    "action_crypto": [", ".join(self._crypto_names[j] for j in np.flatnonzero(mask))
+                                                      or "-" for mask in col_l["action_crypto"][state_idx]],
+                                    "action_detail": [self.state_detail_l[i] for i in state_idx]
+                                }, index=state_idx)
+        return state_df
+
+    def _step_idx(self, t_idx):
+        """
+        @aim: get the index of the step of an action (the current step of the simulation if not given)
+        @input: - t_idx : index of the step or None
+        @output: index of the step
+        """
+
+        return self.simulation.t_idx if t_idx is None else t_idx
+
+    def _step_date(self, t_idx):
+        """
+        @aim: get the date of the step of an action (the current date of the simulation if not given)
+        @input: - t_idx : index of the step or None
+        @output: date of the step
+        """
+
+        return self.simulation.current_date if t_idx is None else self.simulation.date_grid[t_idx]
+
+    def history_df(self):
+        """
+        @aim: get the money and the qte of each crypto of the agent at each step of the simulation
+        @output: dataframe indexed by the date of each step, with the money and a column per crypto
+        """
+
+        # The state only changes with the actions: take the last state of each step and fill the steps in between
+        col_l = self.state_col_l
+        history_df = pd.DataFrame(col_l["available_cryptos"][:self.n_states], columns=list(self._crypto_names),
+                                  index=self.simulation.date_grid[col_l["t_idx"][:self.n_states]])
+        history_df.insert(0, "available_money", col_l["available_money"][:self.n_states])
+        history_df = history_df[~history_df.index.duplicated(keep="last")]
+        return history_df.reindex(self.simulation.date_grid).ffill()
 
 
 # --- Main (just to test and see how it works) --- #
 if __name__ == "__main__":
-    import datetime
     import pandas as pd
     from CryptoMarket import CryptoMarket
     from CryptoAPI import CryptoAPI
@@ -172,16 +394,23 @@ if __name__ == "__main__":
     class Simulation:
         def __init__(self, current_date):
             self.market = CryptoMarket(["BTC"], init_date_test, end_date_test, currency="USD")
+            self.crypto_idx = {"BTC": 0}
             self.api = CryptoAPI(self, imposition_rate=0.01)
-            self.current_date = current_date
+            self.date_grid = self.market.date_grid
+            self.t_idx = self.date_grid.get_loc(current_date)
+            self.n_steps = len(self.date_grid)
             self.agent = None
 
+        @property
+        def current_date(self):
+            return self.date_grid[self.t_idx]
+
         def add_agent(self, agent):
             self.agent = agent
             self.agent.link_to_simulation(self)
 
         def step(self):
-            self.current_date = self.current_date + datetime.timedelta(seconds=60)
+            self.t_idx += 1
             self.agent.step()
 
 
@@ -195,11 +424,11 @@ if __name__ == "__main__":
             self.state = 0
 
         def step(self):
-            # Always sell and buy the first crypto
-            name_of_crypto = list(self.available_crypto_l.keys())[-1]
+            # Always sell and buy the primary crypto
+            name_of_crypto = self._crypto_names[self._primary_crypto_idx]
 
-            if self.state == 0:  # sell all the first crypto
-                self.sell(self.available_crypto_l[name_of_crypto], name_of_crypto)
+            if self.state == 0:  # sell all the primary crypto
+                self.sell(self.holdings[self._primary_crypto_idx], name_of_crypto)
                 self.state = 1
             elif self.state == 1:
                 self.buy(self.available_money, name_of_crypto)
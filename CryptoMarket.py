@@ -7,10 +7,51 @@ Assumes that the
 
 # --- Libraries, constants and parameters --- #
 # Libraries
+import functools
+import logging
 import os
 import sys
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
 import pandas as pd
 
+logger = logging.getLogger(__name__)
+
+# Constants
+OFF_GRID_CACHE_SIZE = 4096  # nb of prices out of the grid kept in memory (asked by several agents on the same step)
+
+
+# --- Functions definition --- #
+def _load_one(args):
+    """
+    @aim: load the df of one crypto and restrain it to the dates of the simulation (module level to run in a process)
+    @input: - args : tuple (crypto_name, currency, crypto_folder, init_date, end_date)
+    @output: tuple (crypto_name, df), df is None if the file was not found
+    """
+
+    crypto_name, currency, crypto_folder, init_date, end_date = args
+
+    # get the df (parquet if converted so, dates already stored as dates, else csv with the dates parsed while reading,
+    # with the arrow parser if installed)
+    crypto_file = os.path.join(crypto_folder, crypto_name + "_" + currency)
+    if os.path.exists(crypto_file + ".parquet"):
+        df = pd.read_parquet(crypto_file + ".parquet", columns=["date", "value"])
+    else:
+        try:
+            try:
+                df = pd.read_csv(crypto_file + ".csv", engine="pyarrow", parse_dates=["date"])
+            except ImportError:
+                df = pd.read_csv(crypto_file + ".csv", parse_dates=["date"])
+        except FileNotFoundError:
+            return crypto_name, None
+
+    # restrain in the correct dates (sorted to slice by binary search, stable to keep the file order)
+    if not df["date"].is_monotonic_increasing:
+        df = df.sort_values("date", kind="stable")
+    df = df.set_index("date").loc[init_date:end_date].reset_index()
+    df = df[~df["date"].duplicated()]  # keep the first value if a date is present twice
+    return crypto_name, df
+
 
 # --- Class definition --- #
 class CryptoMarket:
@@ -18,39 +59,82 @@ class CryptoMarket:
     @aim: implements the crypto market class
     @functions: - __init__ : initialise the market
                 - get_price : get the price on a specific date
-    @parameters:- all_df_dict : dictionary containing the df for each crypto
+                - get_price_at_tick : get the price on a specific step of the grid
+                - get_prices : get the prices on an array of dates
+                - price_row : get the prices of all the cryptos on a specific step of the grid
+                - get_crypto_df : get the raw dataframe of a crypto (for plots)
+    @parameters:- all_df_dict : dictionary containing the df for each crypto (only kept for plots)
+                - prices : array (n_crypto, n_steps) with the prices on the simulation grid (NaN if missing)
+                - crypto_idx : dictionary giving the row of each crypto in the prices (table of the simulation)
+                - price_array : dictionary giving for each crypto its row of prices (view on prices)
+                - _dates, _vals : dict giving for each crypto its sorted dates and values (for dates out of the grid)
+                - _get_price_cached : cached search of a price out of the grid (clear it with .cache_clear())
+                - date_grid : dates of the simulation grid
+                - t0 : first date of the grid
+                - freq_s : nb of seconds between two dates of the grid
     """
 
-    def __init__(self, crypto_name_l, init_date, end_date, currency="USD", crypto_folder="crypto_df"):
+    def __init__(self, crypto_name_l, init_date, end_date, currency="USD", crypto_folder="crypto_df", frequency=60,
+                 date_grid=None, n_workers=None, dtype=np.float32, crypto_idx=None):
         """
         @aim: initialise the market
         @input: - crypto_name_l: list of the name of the cryptos to consider (BTC/...)
                 - init_date, end_date: start and end date of the simulation (pd.datetime format)
                 - currency: official money to consider (USD/...)
                 - crypto_folder: name of the folder containing the saved df in OUR format (see crypto_data_to_df.py)
+                - frequency: nb of seconds between two steps of the simulation (grid on which prices are requested)
+                - date_grid: dates of the simulation grid if already built (built from the dates/frequency if None)
+                - n_workers: nb of processes loading the files in parallel (None: one per crypto, up to the nb of
+                             cores; 1: load them in this process)
+                - dtype: dtype of the prices on the grid (float32 is enough for ~7 significant digits, float64 if the
+                         cryptos need more)
+                - crypto_idx: dict giving the index of each crypto (the one shared by the simulation and its agents,
+                              built from crypto_name_l if None)
         """
 
         df_list = []
-
-        # For each crypto create the filename (crypto+currency) and load the df
-        for crypto_name in crypto_name_l:
-            try:
-                # get the df
-                crypto_file = crypto_name + "_" + currency + ".csv"
-                df = pd.read_csv(os.path.join(crypto_folder, crypto_file))
-                df["date"] = pd.to_datetime(df["date"])
-                # restrain in the correct dates
-                df = df[df["date"] >= init_date]
-                df = df[df["date"] <= end_date]
-                df_list.append(df)
-            except FileNotFoundError:
-                print("{} with currency {} not found in the df.".format(crypto_name, currency))
+        self._dates = {}
+        self._vals = {}
+        self._get_price_cached = functools.lru_cache(maxsize=OFF_GRID_CACHE_SIZE)(self._search_price)
+        self.t0 = init_date
+        self.freq_s = frequency
+        if date_grid is None:
+            date_grid = pd.date_range(init_date, end_date, freq=pd.Timedelta(seconds=frequency))
+        self.date_grid = date_grid
+        self.prices = np.full((len(crypto_name_l), len(date_grid)), np.nan, dtype=dtype)
+        if crypto_idx is None:
+            crypto_idx = {crypto_name: i for i, crypto_name in enumerate(crypto_name_l)}
+        self.crypto_idx = crypto_idx
+
+        # For each crypto load the df (in parallel processes if several cryptos), results in the order of the list
+        load_args_l = [(crypto_name, currency, crypto_folder, init_date, end_date) for crypto_name in crypto_name_l]
+        if n_workers is None:
+            n_workers = min(len(crypto_name_l), os.cpu_count() or 1)
+        if n_workers > 1:
+            with ProcessPoolExecutor(max_workers=n_workers) as executor:
+                loaded_l = list(executor.map(_load_one, load_args_l))
+        else:
+            loaded_l = [_load_one(load_args) for load_args in load_args_l]
+
+        for crypto_name, df in loaded_l:
+            if df is None:
+                logger.error("{} with currency {} not found in the df.".format(crypto_name, currency))
                 sys.exit()
+            df_list.append(df)
+            # precompute the lookups once (row of the dense array on the grid, sorted arrays for the other dates)
+            self._dates[crypto_name] = df["date"].to_numpy(dtype="datetime64[ns]")
+            self._vals[crypto_name] = df["value"].to_numpy(dtype=np.float64)
+            self.prices[self.crypto_idx[crypto_name]] = df.set_index("date")["value"].reindex(date_grid)
+            # check early that the data is aligned on the grid (else no step of the simulation would happen)
+            if len(df) > 0 and np.isnan(self.prices[self.crypto_idx[crypto_name]]).all():
+                raise ValueError("No date of {} is on the simulation grid (every {}s from {}).".format(
+                    crypto_name, frequency, init_date))
 
         # Convert to dict
         self.all_df_dict = dict(zip(crypto_name_l, df_list))
+        self.price_array = {crypto_name: self.prices[i] for crypto_name, i in self.crypto_idx.items()}
 
-        print("Market created!")
+        logger.info("Market created!")
 
     def get_price(self, crypto_name, date):
         """
@@ -60,13 +144,68 @@ class CryptoMarket:
         @output:  price of this crypto at that moment
         """
 
-        try:
-            df = self.all_df_dict[crypto_name]
-            row = df[df["date"] == date].iloc[0]  # .iloc[0] to get only the value and not the cell
-            return row["value"]
-        except IndexError:
-            print("{} of {} was not found in the dataframe".format(date, crypto_name))
+        # Directly index the array if the date is on the grid, else search in the sorted dates
+        prices = self.price_array[crypto_name]
+        offset_s = (date - self.t0).total_seconds()
+        idx = int(offset_s // self.freq_s)
+        if offset_s % self.freq_s == 0 and 0 <= idx < len(prices):
+            price = prices[idx]
+        else:
+            price = self._get_price_cached(crypto_name, pd.Timestamp(date).value)
+
+        if np.isnan(price):
+            logger.warning("{} of {} was not found in the dataframe".format(date, crypto_name))
             return False
+        return float(price)
+
+    def get_price_at_tick(self, crypto_name, t_idx):
+        """
+        @aim: get the price of a crypto on a specific step of the grid (direct index in its row of prices)
+        @input: - crypto_name : name of the crypto
+                - t_idx : index of the step on the grid
+        @output:  price of this crypto at that step
+        """
+
+        price = self.price_array[crypto_name][t_idx]
+        if np.isnan(price):
+            logger.warning("{} of {} was not found in the dataframe".format(self.date_grid[t_idx], crypto_name))
+            return False
+        return float(price)
+
+    def get_prices(self, crypto_name, dates):
+        """
+        @aim: get the prices of a crypto on several dates at once (binary search in the sorted dates)
+        @input: - crypto_name : name of the crypto
+                - dates : array of dates of the request
+        @output:  array with the price of this crypto at each date (NaN if not found)
+        """
+
+        known_dates = self._dates[crypto_name]
+        dates = np.asarray(dates, dtype="datetime64[ns]")
+        if len(known_dates) == 0:
+            return np.full(dates.shape, np.nan)
+
+        idx = np.minimum(np.searchsorted(known_dates, dates), len(known_dates) - 1)
+        return np.where(known_dates[idx] == dates, self._vals[crypto_name][idx], np.nan)
+
+    def _search_price(self, crypto_name, date_ns):
+        """
+        @aim: search the price of a crypto on a date out of the grid (wrapped by the cache _get_price_cached)
+        @input: - crypto_name : name of the crypto
+                - date_ns : date of the request in ns (int to be hashable)
+        @output:  price of this crypto at that moment (NaN if not found)
+        """
+
+        return self.get_prices(crypto_name, [np.datetime64(date_ns, "ns")])[0]
+
+    def price_row(self, t_idx):
+        """
+        @aim: get the prices of all the cryptos on a specific step of the grid
+        @input: - t_idx : index of the step on the grid
+        @output:  view on the prices of each crypto at that step (NaN if missing)
+        """
+
+        return self.prices[:, t_idx]
 
     def get_crypto_df(self, crypto_name):
         """
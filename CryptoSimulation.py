@@ -5,18 +5,44 @@
 """
 
 # --- Libraries, constants and parameters --- #
-import matplotlib.pyplot as plt
-from matplotlib.pyplot import cm
-import matplotlib.dates as mdates
-from matplotlib.lines import Line2D
+# (matplotlib and seaborn are only imported by the plots, a simulation without evaluate does not load them)
 import numpy as np
+import os
 import pandas as pd
-import seaborn as sns
+from CryptoAgent import ActionCode, ACTION_TYPE_L
 from CryptoMarket import CryptoMarket
 from CryptoAPI import CryptoAPI
-from datetime import timedelta
+from AgentPool import AgentPool
+from concurrent.futures import ThreadPoolExecutor
 
-sns.set(style="whitegrid")
+# Constants
+BATCH_SIZE = 4096  # nb of steps given at once to the agents that can decide on a batch of steps
+MAX_PLOT_POINTS = 4000  # nb of points above which a series is reduced for the display (more than the pixels)
+
+
+# --- Functions definition --- #
+def decimate_series(x, y, max_points=MAX_PLOT_POINTS):
+    """
+    @aim: reduce a long series to about max_points for the display, keeps the min and the max of each bucket of
+          consecutive points in their order (the envelope of the curve is the same, a missing value leaves a gap)
+    @input: - x : array of the x of the points
+            - y : array of the y of the points
+            - max_points : nb of points to keep (about)
+    @output: x and y of the points kept
+    """
+
+    stride = len(y) // (max_points // 2)
+    if stride < 2:
+        return x, y
+
+    # min and max of each full bucket (argmin/argmax give the first NaN of a bucket if any) and the last points,
+    # sorted back in the order of the series
+    n_full = len(y) // stride * stride
+    buckets = y[:n_full].reshape(-1, stride)
+    bucket_start = np.arange(0, n_full, stride)
+    kept_idx = np.unique(np.concatenate([bucket_start + buckets.argmin(axis=1), bucket_start + buckets.argmax(axis=1),
+                                         np.arange(n_full, len(y))]))
+    return x[kept_idx], y[kept_idx]
 
 
 # --- Class definition --- #
@@ -26,8 +52,11 @@ class CryptoSimulation:
           At the end it displays the performance of each agent
     @functions: - __init__ : initialise the simulation
                 - add_agent : add a new agent to the simulation
+                - current_date : date of the simulation at this step (computed from t_idx when asked)
                 - step : does a step in the simulation
-                - simulate : run the whole simulation
+                - step_batch : does a batch of consecutive steps in the simulation
+                - simulate : run the whole simulation (by batches of BATCH_SIZE steps)
+                - simulate_batch : run at once many agents of a class that only differ by their parameters
                 - evaluate : evaluates the different agent and calls other functions to plot the performances
                     - plot_summary_table : summary of the benefice / qte of each crypto
                     - plot_money_evolution : plot the evolution of the money that the agent accumulated
@@ -36,18 +65,30 @@ class CryptoSimulation:
                     - add_agent_actions : adds to some axis a line indicating that an agent did an action
     @parameters:- init_date : first date of the simulation (included)
                 - end_date : last date of the simulation (included)
-                - current_date : date of the simulation at this step
+                - t_idx : index of the current step (0 is the init_date)
+                - date_grid : date of each step (from init_date to end_date, every frequency seconds)
+                - n_steps : nb of steps between init_date and end_date (both included)
                 - market : market object from the market class to get price
                 - api : api object from the api class to get the transaction
                 - agent_l : list of all the agents in the simulation
+                - batch_agent_l : list of the agents deciding on a batch of steps at once (if their class has a
+                                  step_batch), or of the pools of them if their class has a pool_batch_kernel
+                - batch_pool_l : dict of the pools grouping the agents of a same type and crypto, key is (class, index
+                                 of the crypto)
+                - single_agent_l : list of the other agents (step called one by one, if needed)
                 - currency : currency used to make the money transaction
                 - frequency : nb of seconds between step
                 - verbose : display or not text in the simulation
                 - crypto_name_l : list of the crypto that are used in the simulation
+                - n_threads : nb of threads used to step the batch agents (and pools) in parallel (1 to step them one
+                              after the other)
+                - crypto_idx : dict giving the index of each crypto (shared by all the agents for their holdings)
+                - _agent_colors : array (n_agents, 4) with the color of each agent in the plots (built by evaluate)
     """
 
     def __init__(self, init_date, end_date, crypto_name_l, imposition_rate=0.01,
-                 currency="USD", frequency=60, verbose=True, crypto_folder="crypto_df"):
+                 currency="USD", frequency=60, verbose=True, crypto_folder="crypto_df", n_threads=1,
+                 price_dtype=np.float32):
         """
         @aim: initialise the simulation
         @input: - init_date : first date of the simulation (included)
@@ -58,80 +99,168 @@ class CryptoSimulation:
                 - frequency : frequency at which the simulation increments (in seconds)
                 - verbose : display or not text in the simulation
                 - crypto_folder : name of the folder with the df of the crypto price evolution
+                - n_threads : nb of threads used to step the batch agents (and pools) in parallel (None to use all the
+                              cores), they are synchronised once per batch
+                - price_dtype : dtype of the prices in the market (float64 if the cryptos need more than float32)
         """
 
         # Instantiate all the parameters of the simulation
         self.init_date = init_date
         self.end_date = end_date
-        self.current_date = init_date
+        self.t_idx = 0
         self.crypto_name_l = crypto_name_l
+        self.crypto_idx = {crypto_name: i for i, crypto_name in enumerate(crypto_name_l)}
         self.currency = currency
         self.frequency = frequency
         self.verbose = verbose
+        self.n_threads = n_threads if n_threads is not None else os.cpu_count()
         self.agent_l = {}
-
-        # Create the marker and the API
-        self.market = CryptoMarket(crypto_name_l, init_date, end_date, currency, crypto_folder)
+        self.batch_agent_l = []
+        self.batch_pool_l = {}
+        self.single_agent_l = []
+        self._executor = None
+        self._agent_colors = None
+
+        # Generate the dates of all the steps once (a step is then only an index in it)
+        self.date_grid = pd.date_range(init_date, end_date, freq=pd.Timedelta(seconds=frequency))
+        self.n_steps = len(self.date_grid)
+
+        # Create the marker and the API (all the prices are on one array of the market, aligned on the grid)
+        self.market = CryptoMarket(crypto_name_l, init_date, end_date, currency, crypto_folder, frequency,
+                                   self.date_grid, dtype=price_dtype, crypto_idx=self.crypto_idx)
         self.api = CryptoAPI(self, imposition_rate)
 
         if verbose:
             print("Simulation will be executed from the {} to the {}".format(init_date, end_date))
             print("The following cryptos will be considered {}".format(crypto_name_l))
 
+    @property
+    def current_date(self):
+        """
+        @aim: get the date of the current step (only built when someone asks for it)
+        @output: date of the current step
+        """
+
+        return self.date_grid[self.t_idx]
+
     def add_agent(self, agent):
         """
         @aim: add an agent in the simulation
         @input: - agent : agent object (from the agent class) to add in the simulation
         """
 
-        # Add it in the dict
+        # Add it in the dict (its index gives its row in the arrays of the simulation, i.e. its color)
+        agent._idx = len(self.agent_l)
         self.agent_l[agent.name] = agent
         # Link it to this simulation
         self.agent_l[agent.name].link_to_simulation(self)
         # Add the initial state
-        self.agent_l[agent.name].add_state(self.current_date, "start", "-", "-")
+        self.agent_l[agent.name].add_state(ActionCode.START, None, "-")
+        # Let it decide on whole batches if it can, grouped with the agents of the same type and crypto if they can
+        # decide all at once (not called if nothing to do)
+        if not agent.needs_step:
+            pass
+        elif agent.step_batch is not None and agent.pool_batch_kernel is not None:
+            # the pool is stepped as a batch agent (one pass on the prices for all the agents of the pool)
+            pool_key = (type(agent), agent.pool_params()[0])
+            if pool_key not in self.batch_pool_l:
+                self.batch_pool_l[pool_key] = AgentPool(agent.pool_batch_kernel)
+                self.batch_agent_l.append(self.batch_pool_l[pool_key])
+            self.batch_pool_l[pool_key].add_agent(agent)
+        elif agent.step_batch is not None:
+            self.batch_agent_l.append(agent)
+        else:
+            self.single_agent_l.append(agent)
 
     def step(self):
         """
         @aim: makes a step in the simulation (size of the step depends on self -> frequency)
         """
 
-        # Update the date (first step skipped -> ok to init agents with first day values)
-        self.current_date = self.current_date + timedelta(seconds=self.frequency)
+        self.step_batch(self.t_idx + 1, self.t_idx + 2)
 
-        # Check that we have all values for this moment (may have some missing hours)
-        all_available = True
-        for crypto_name in self.crypto_name_l:
-            if not self.market.get_price(crypto_name, self.current_date):
-                all_available = False
+    def step_batch(self, t_start, t_end):
+        """
+        @aim: makes the steps from t_start to t_end (excluded) in the simulation, the agents that can decide on the
+              whole batch are called once, the others at each step
+        @input: - t_start : index of the first step of the batch (the step after the current one)
+                - t_end : index of the step after the last one of the batch
+        """
 
-        # Execute agents steps if data available
-        if all_available:
-            for name, agent in self.agent_l.items():
-                agent.step()
+        # Execute agents steps only where all values are available (may have some missing hours)
+        prices_block = self.market.prices[:, t_start:t_end]
+        valid = ~np.isnan(prices_block).any(axis=0)
+
+        # The batch agents do not share anything (and give the step of their actions), one task per agent that runs
+        # while the single agents are stepped
+        batch_future_l = []
+        if self._executor is not None and len(self.batch_agent_l) > 1:
+            batch_future_l = [self._executor.submit(agent.step_batch, t_start, t_end, prices_block, valid)
+                              for agent in self.batch_agent_l]
+        else:
+            for agent in self.batch_agent_l:
+                agent.step_batch(t_start, t_end, prices_block, valid)
+
+        if self.single_agent_l:
+            for t_idx in t_start + np.flatnonzero(valid):
+                self.t_idx = int(t_idx)
+                prices_row = prices_block[:, self.t_idx - t_start]
+                for agent in self.single_agent_l:
+                    agent.vector_step(self.t_idx, prices_row)
+
+        # wait for the batch agents before the next batch (.result() raises their errors)
+        for future in batch_future_l:
+            future.result()
+        self.t_idx = t_end - 1
 
     def simulate(self):
         """
         @aim: run the whole simulation (start to end date)
         """
 
-        print("Simulation starts\n")
-
-        # Run the simulation (check that next step in frequency will before or at the end date)
-        while self.current_date + timedelta(seconds=self.frequency - 1) <= self.end_date:
-            self.step()
+        if self.verbose:
+            print("Simulation starts\n")
+
+        # Run the simulation by batches up to the end date (first step skipped -> ok to init agents with first day
+        # values), with the threads if needed
+        if self.n_threads > 1 and len(self.batch_agent_l) > 1:
+            self._executor = ThreadPoolExecutor(max_workers=self.n_threads)
+        try:
+            for t_start in range(self.t_idx + 1, self.n_steps, BATCH_SIZE):
+                self.step_batch(t_start, min(t_start + BATCH_SIZE, self.n_steps))
+        finally:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
 
         # Save the end state of each agent
         for agent in self.agent_l.values():
-            agent.add_state(self.current_date, "end", "-", "-")
+            agent.add_state(ActionCode.END, None, "-")
 
-        print("Simulation ended.")
+        if self.verbose:
+            print("Simulation ended.")
 
-    def plot_summary_table(self, axis, color_agent_dict):
+    def simulate_batch(self, agent_class, init_money, init_repartition, param_grid):
+        """
+        @aim: run the whole simulation for many agents of a class that only differ by their parameters, all at once
+              on the prices of the simulation (the agents are not created, nor added to the simulation)
+        @input: - agent_class : class of the agents (has to implement sweep, i.e. WaitIncreaseAgent)
+                - init_money : money that each agent has at the beginning
+                - init_repartition : initial repartition of the money of each agent along cryptos
+                - param_grid : dict with the other parameters of the agents, an array with one value per agent for
+                               the ones that change (i.e. {"name_of_crypto": "BTC", "sell_th": [0.01, 0.02]})
+        @output: array (n_agents, n_steps) with the total value of each agent at each step, nb of actions of each agent
+        """
+
+        if agent_class.sweep is None:
+            raise TypeError("{} cannot be simulated by batch of parameters (no sweep).".format(agent_class.__name__))
+        return agent_class.sweep(self, init_money, init_repartition, **param_grid)
+
+    def plot_summary_table(self, axis, agent_colors):
         """
         @aim: print a summary table with the initial money of each agent and its final balance
         @input: - axis : axis on which print the results
-                - color_agent_dict : dict of color associated to each agent
+                - agent_colors : array (n_agents, 4) with the color of each agent (row given by agent._idx)
         """
 
         # Prepare the axis and the table
@@ -146,13 +275,13 @@ class CryptoSimulation:
 
         # Fill the table array
         for i, agent in enumerate(self.agent_l.values()):
-            cell_text[0, i] = agent.state_hist[-1]["total_value"]
+            last = agent.n_states - 1
+            cell_text[0, i] = agent.state_col_l["total_value"][last]
             cell_text[1, i] = agent.init_money
-            cell_text[2, i] = agent.state_hist[-1]["total_value"] - agent.init_money
-            cell_text[3, i] = agent.state_hist[-1]["available_money"]
-            cell_text[4, i] = agent.state_hist[-1]["earned_money"]
-            for j, crypto_name in enumerate(self.crypto_name_l):
-                cell_text[5 + j, i] = agent.state_hist[-1]["available_cryptos"][crypto_name]
+            cell_text[2, i] = agent.state_col_l["total_value"][last] - agent.init_money
+            cell_text[3, i] = agent.state_col_l["available_money"][last]
+            cell_text[4, i] = agent.state_col_l["earned_money"][last]
+            cell_text[5:, i] = agent.state_col_l["available_cryptos"][last]  # same order as crypto_name_l
 
         # Print the array in the table
         table = axis.table(cellText=cell_text, rowLabels=row_labels, colLabels=col_labels, cellLoc='center',
@@ -163,24 +292,26 @@ class CryptoSimulation:
         # Add the title and the color of each agent
         axis.set_title('Final performance of the agents.')
         for i, agent in enumerate(self.agent_l.values()):
-            table[(0, i)].set_facecolor(color_agent_dict[agent.name])
+            table[(0, i)].set_facecolor(agent_colors[agent._idx])
 
-    def plot_money_evolution(self, axis, color_agent_dict, history_agent_df_dict):
+    def plot_money_evolution(self, axis, agent_colors, history_agent_df_dict):
         """
         @aim: show the evolution of the money that each agent possess
         @input: - axis : axis on which print the results
-                - color_agent_dict : dict of color associated to each agent
+                - agent_colors : array (n_agents, 4) with the color of each agent (row given by agent._idx)
                 - history_agent_df_dict : a dict giving for each agent a dataframe containing the state of each one
         """
 
-        # Plot for each agent the evolution
-        for agent_name, agent_df in history_agent_df_dict.items():
-            sns.lineplot(data=agent_df, ax=axis, x="date", y="total_value", linestyle="solid",
-                         color=color_agent_dict[agent_name])
-            sns.lineplot(data=agent_df, ax=axis, x="date", y="available_money", linestyle="dashed",
-                         color=color_agent_dict[agent_name])
-            sns.lineplot(data=agent_df, ax=axis, x="date", y="earned_money", linestyle="dotted",
-                         color=color_agent_dict[agent_name])
+        from matplotlib.lines import Line2D
+
+        # Plot for each agent the evolution (the three values in one call, then one style per line)
+        for agent in self.agent_l.values():
+            agent_df = history_agent_df_dict[agent.name]
+            line_l = axis.plot(agent_df["date"].to_numpy(),
+                               agent_df[["total_value", "available_money", "earned_money"]].to_numpy(),
+                               color=agent_colors[agent._idx])
+            for line, linestyle in zip(line_l, ["solid", "dashed", "dotted"]):
+                line.set_linestyle(linestyle)
 
         # Add the tile and axis
         axis.set_title("Real money value along time")
@@ -193,19 +324,20 @@ class CryptoSimulation:
                           Line2D([0], [0], color="grey", label='Value')]
         axis.legend(loc='center left', bbox_to_anchor=(1, 0.5), handles=legend_patch_l)
 
-    def plot_crypto_qte_evolution(self, axis_l, color_agent_dict, history_agent_df_dict):
+    def plot_crypto_qte_evolution(self, axis_l, agent_colors, history_agent_df_dict):
         """
         @aim: show the evolution of the qte of crypto of each agent
         @input: - axis_l : list of axis on which print the results (has to be the same nb as the nb of crypto)
-                - color_agent_dict : dict of color associated to each agent
+                - agent_colors : array (n_agents, 4) with the color of each agent (row given by agent._idx)
                 - history_agent_df_dict : a dict giving for each agent a dataframe containing the state of each one
         """
 
         # For each agent and crypto display the evolution
         for j, crypto_name in enumerate(self.crypto_name_l):
             for i, agent in enumerate(self.agent_l.values()):
-                sns.lineplot(data=history_agent_df_dict[agent.name], ax=axis_l[j], x="date", y=crypto_name,
-                             label=agent.name, color=color_agent_dict[agent.name])
+                agent_df = history_agent_df_dict[agent.name]
+                axis_l[j].plot(agent_df["date"].to_numpy(), agent_df[crypto_name].to_numpy(),
+                               color=agent_colors[agent._idx])  # agents named in the legend of the figure
 
             axis_l[j].set_xlabel("Date")
             axis_l[j].set_title("Evolution of qte of {} along time".format(crypto_name))
@@ -217,37 +349,48 @@ class CryptoSimulation:
         @input: - axis_l : list of axis on which print the results (has to be the same nb as the nb of crypto)
         """
 
-        # For each crypto show the price evolution
+        # For each crypto show the price evolution on the steps of the simulation (grid shared by all the cryptos),
+        # reduced to the points that can be seen and drawn as an image in vector outputs
         for j, crypto_name in enumerate(self.crypto_name_l):
-            df_crypto = self.market.get_crypto_df(crypto_name)
-            df_crypto["date"] = pd.to_datetime(df_crypto["date"])
-            sns.lineplot(data=df_crypto, ax=axis_l[j], x=df_crypto["date"], y=df_crypto["value"])
+            line_l = axis_l[j].plot(*decimate_series(self.date_grid, self.market.price_array[crypto_name]),
+                                    linewidth=0.5)
+            for line in line_l:
+                line.set_rasterized(True)
 
             axis_l[j].set_xlabel("Date")
             axis_l[j].set_title("Value of {} along time".format(crypto_name))
             axis_l[j].set_ylabel("Qte {}".format(crypto_name))
 
-    def add_agent_actions(self, axis_l, color_agent_dict, history_agent_df_dict):
+    def add_agent_actions(self, axis_l, agent_colors, history_agent_df_dict):
         """
         @aim: adds vertical lines to indicate the action of an agent on this date and the kind of action
         @input: - axis_l : list of axis on which print the actions
-                - color_agent_dict : dict of color associated to each agent
+                - agent_colors : array (n_agents, 4) with the color of each agent (row given by agent._idx)
                 - history_agent_df_dict : a dict giving for each agent a dataframe containing the state of each one
         """
 
-        # For each axis print the action of each agent
+        from matplotlib.lines import Line2D
+
+        # Select once for each agent the dates of each kind of action on each crypto
+        action_style_l = {ActionCode.BUY: "dotted", ActionCode.SELL: "dashed", ActionCode.BOTH: "solid"}
+        action_date_l = {}
+        for agent in self.agent_l.values():
+            agent_df = history_agent_df_dict[agent.name]
+            dates = agent_df["date"].to_numpy()
+            action_code = agent_df["action_type"].cat.codes.to_numpy()  # categories in the order of the codes
+            on_crypto = agent.state_col_l["action_crypto"][agent_df.index]  # index of the df is the one of the state
+            action_date_l[agent.name] = {action: [dates[(action_code == action) & on_crypto[:, k]]
+                                                  for k in range(len(self.crypto_name_l))]
+                                         for action in action_style_l}
+
+        # For each axis print the action of all the agents (one collection of vertical lines per kind of action,
+        # each line with the color of its agent)
         for j, ax in enumerate(axis_l):
-            for i, agent in enumerate(self.agent_l.values()):
-                for _, action_row in history_agent_df_dict[agent.name].iterrows():
-                    if action_row["action_type"] == "buy" \
-                            and self.crypto_name_l[j // 2] in action_row["action_crypto"]:
-                        ax.axvline(x=action_row["date"], linestyle='dotted', color=color_agent_dict[agent.name])
-                    if action_row["action_type"] == "sell" and \
-                            self.crypto_name_l[j // 2] in action_row["action_crypto"]:
-                        ax.axvline(x=action_row["date"], linestyle='dashed', color=color_agent_dict[agent.name])
-                    if action_row["action_type"] == "both" and \
-                            self.crypto_name_l[j // 2] in action_row["action_crypto"]:
-                        ax.axvline(x=action_row["date"], color=color_agent_dict[agent.name])
+            for action, linestyle in action_style_l.items():
+                date_l = [action_date_l[agent.name][action][j // 2] for agent in self.agent_l.values()]
+                agent_idx = np.repeat([agent._idx for agent in self.agent_l.values()], [len(d) for d in date_l])
+                ax.vlines(np.concatenate(date_l), 0, 1, transform=ax.get_xaxis_transform(), linestyles=linestyle,
+                          colors=agent_colors[agent_idx])
 
             # Add the legend on the axis
             legend_patch_l = [Line2D([0], [0], color="grey", label='Sell', linestyle='dashed'),
@@ -265,42 +408,48 @@ class CryptoSimulation:
                 - add_agent_actions : adds to some axis a line indicating that an agent did an action
         """
 
+        import matplotlib.pyplot as plt
+        import matplotlib.dates as mdates
+        from matplotlib.pyplot import cm
+        from matplotlib.lines import Line2D
+        import seaborn as sns
+        sns.set(style="whitegrid")
+
         # Define the general figure
         eval_fig, eval_axs = plt.subplots(2 + 2 * len(self.crypto_name_l),
                                           sharex="all")  # table, all money, 2 plot for each crypto
         eval_fig.suptitle('Simulation results')
 
         # Associate a color to each agent
-        colors = cm.rainbow(np.linspace(0, 1, len(self.agent_l)))
-        color_agent_dict = {}
-        for i, agent in enumerate(self.agent_l.values()):
-            color_agent_dict[agent.name] = colors[i]
+        self._agent_colors = cm.rainbow(np.linspace(0, 1, len(self.agent_l)))
+        agent_legend_l = [Line2D([0], [0], color=self._agent_colors[agent._idx], label=agent.name)
+                          for agent in self.agent_l.values()]
 
         # Prepare the history of actions of each agent
         history_agent_df_dict = {}
         for i, agent in enumerate(self.agent_l.values()):
-            # Convert the list of dict of this agent to a df
-            agent_hist = agent.state_hist
-            df_tmp = pd.DataFrame.from_dict(agent_hist)
-
-            # Explode the list of available cryptos to different columns
-            df_tmp[self.crypto_name_l] = df_tmp["available_cryptos"].apply(pd.Series)
+            # If sell and bought at the same point, only take the last one (last state of each step, from the
+            # first occurrence of each step in the reversed states)
+            t_idx = agent.state_col_l["t_idx"][:agent.n_states]
+            _, first_rev_idx, counts = np.unique(t_idx[::-1], return_index=True, return_counts=True)
+            last_idx = len(t_idx) - 1 - first_rev_idx
 
-            # If sell and bought at the same point, only take the last one
-            duplicated_mask = df_tmp["date"].duplicated(keep=False)  # take all duplicates
-            df_tmp.loc[duplicated_mask, "action_type"] = "both"
-            df_tmp = df_tmp.drop_duplicates(subset="date", keep="last")
+            # Get these states of this agent as a df (already one column per crypto)
+            df_tmp = agent.state_df(last_idx)
+            action_code = np.where(counts == 1, agent.state_col_l["action_type"][last_idx], ActionCode.BOTH)
+            df_tmp["action_type"] = pd.Categorical.from_codes(action_code, ACTION_TYPE_L)
 
             # Add the df to the dict
             history_agent_df_dict[agent.name] = df_tmp
 
         # Plots
-        self.plot_summary_table(eval_axs[0], color_agent_dict)
-        self.plot_money_evolution(eval_axs[1], color_agent_dict, history_agent_df_dict)
+        self.plot_summary_table(eval_axs[0], self._agent_colors)
+        self.plot_money_evolution(eval_axs[1], self._agent_colors, history_agent_df_dict)
         self.plot_crypto_qte_evolution([eval_axs[2 + 2 * i] for i in range(0, len(self.crypto_name_l))],
-                                       color_agent_dict, history_agent_df_dict)
+                                       self._agent_colors, history_agent_df_dict)
         self.plot_crypto_market_evolution([eval_axs[3 + 2 * i] for i in range(0, len(self.crypto_name_l))])
-        self.add_agent_actions(eval_axs[2:], color_agent_dict, history_agent_df_dict)
+        self.add_agent_actions(eval_axs[2:], self._agent_colors, history_agent_df_dict)
+        eval_fig.legend(handles=agent_legend_l, loc="upper right")  # one legend of the agents for all the axis
 
         # Format the figure
         plt.gca().xaxis.set_major_formatter(mdates.DateFormatter('%Y-%m-%d %H:%M'))
@@ -16,9 +16,12 @@ class SleepingAgent(CryptoAgent):
                 - step : does nothing but needed because abstract function
                 - load_init_info : loads nothing but needed because abstract function
                 - others : see the parent class
-    @parameters:- others : see the parent class
+    @parameters:- needs_step : False, the simulation does not have to call the step
+                - others : see the parent class
     """
 
+    needs_step = False
+
     def __init__(self, name, crypto_name_l, init_money, init_repartition):
         """
         @aim: initialise the agent
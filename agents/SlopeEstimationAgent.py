@@ -6,21 +6,41 @@
 """
 
 # --- Libraries, constants and parameters --- #
-from CryptoAgent import CryptoAgent
-from collections import deque
-from scipy.stats import linregress
+import math
 import numpy as np
+from CryptoAgent import CryptoAgent
 
 
 # --- Class definition --- #
 class SlopeEstimationAgent(CryptoAgent):
     """
-    @aim: ???
-    @functions: ???
-    @parameters: ???
+    @aim: implements an agent that sells when the price increased enough since the last transaction and starts to
+    decrease (slope of the last prices), and buys again when it decreased enough and starts to increase.
+    Only works on one crypto.
+    @functions: - __init__ : initialise the agent
+                - step : stores the new price, updates the slope and decides to sell/buy
+                - vector_step : same as step but uses the prices gathered by the simulation
+                - check_slope : updates the slope with the new price and decides to sell/buy
+                - _store, _shift : add a price in the memory (and update the sums) while it fills / once full
+                - _slope : least squares slope of the prices in the memory (from the sums)
+                - load_init_info : get the initial price of the crypto
+                - others : see the parent class
+    @parameters:- name_of_crypto : name of the crypto to consider (only works on one)
+                - sell_th, buy_th, slope_th, memory_size : see __init__
+                - last_transaction_price : price of the crypto at the last sell/buy
+                - memory : ring buffer of the last memory_size prices (oldest one at _head once full), in the dtype of
+                           the prices of the market (float32 by default, the sums are kept in float64)
+                - _count, _head : nb of prices stored, index of the oldest price in the memory
+                - _y_sum, _ty_sum : sum of the prices and of the prices weighted by their age rank (0 is the oldest),
+                                    updated with each new price to get the slope without a regression
+                - _x_sum, _denom : constant parts of the least squares slope formula
+                - mode : "has_to_sell" or "has_to_buy"
+                - crypto_row : index of the crypto in the prices of the simulation
+                - others : see the parent class
     """
 
-    def __init__(self, name, crypto_name_l, init_money, init_repartition, name_of_crypto, sell_th, buy_th, slope_th, memory_size):
+    def __init__(self, name, crypto_name_l, init_money, init_repartition, name_of_crypto, sell_th, buy_th, slope_th,
+                 memory_size):
         """
         @aim: initialise the agent
         @input: - name_of_crypto : name of the crypto to consider (only works on one)
@@ -38,55 +58,137 @@ class SlopeEstimationAgent(CryptoAgent):
         self.slope_th = slope_th
         self.last_transaction_price = None
         self.enough_data_gathered = False  # at the beginning the algo does not have enough information
-        self.memory = []  # memory of the previous values of the agent (element [0] is the oldest and [-1] the newest)
+        self.memory = None  # ring buffer of the previous values of the agent (allocated once linked)
+        self._count = 0
+        self._head = 0
+        self._y_sum = np.float64(0.0)  # numpy float64 so that adding the float32 prices keeps the float64 precision
+        self._ty_sum = np.float64(0.0)
+        self._x_sum = memory_size * (memory_size - 1) / 2
+        self._denom = memory_size * (memory_size - 1) * memory_size * (2 * memory_size - 1) / 6 - self._x_sum ** 2
         self.mode = "has_to_sell"
         self.memory_size = memory_size
+        self.crypto_row = None
 
     def step(self):
         """
-        @aim: ???
+        @aim: stores the new price, updates the slope and decides to sell/buy
+        """
+
+        current_price = self.simulation.market.get_price_at_tick(self.name_of_crypto, self.simulation.t_idx)
+        self.check_slope(current_price)
+
+    def vector_step(self, t_idx, prices_row):
+        """
+        @aim: same as step but the price is read from the prices gathered by the simulation
+        @input: - t_idx : index of the step in the simulation
+                - prices_row : price of each crypto of the simulation at this step
         """
 
-        # Get the price
-        current_price = self.simulation.market.get_price(self.name_of_crypto, self.simulation.current_date)
+        self.check_slope(prices_row[self.crypto_row])
+
+    def check_slope(self, current_price):
+        """
+        @aim: updates the slope of the last prices with the new one and sells/buys if the thresholds are reached
+        @input: - current_price : price of the crypto at this step
+        """
 
         # Check that enough data has been accumulated
         if not self.enough_data_gathered:
             # if this is not the case, just store data
-            self.memory.append(current_price)
-            self.enough_data_gathered = len(self.memory) >= self.memory_size
+            self._store(current_price)
+            self.enough_data_gathered = self._count >= self.memory_size
         else:
-            # if enough data, add the new information and remove the old one
-            memory_tmp = deque(self.memory)
-            memory_tmp.popleft()
-            memory_tmp.append(current_price)
-            self.memory = memory_tmp
-
-            # compute the current slope
+            # if enough data, replace the oldest value by the new one and compute the current slope
+            self._shift(current_price)
             perc_diff = (current_price - self.last_transaction_price) / self.last_transaction_price
-            lr = linregress(np.arange(self.memory_size), self.memory)
-            angle_lr = 360*np.arctan(lr.slope)/(2*np.pi)
+            angle_lr = math.degrees(math.atan(self._slope()))
 
             if self.mode == "has_to_sell":
                 if perc_diff > self.sell_th and angle_lr < -self.slope_th:
                     self.last_transaction_price = current_price
-                    self.sell(self.available_crypto_l[self.name_of_crypto], self.name_of_crypto)
+                    self.sell(self.holdings[self.crypto_row], self.name_of_crypto)
                     self.mode = "has_to_buy"
                     if self.simulation.verbose:
-                        print("Sell action by {} on {} (slope {})".format(self.name, self.simulation.current_date, angle_lr))
+                        print("Sell action by {} on {} (slope {})".format(self.name, self.simulation.current_date,
+                                                                          angle_lr))
             elif self.mode == "has_to_buy":
                 if perc_diff < self.buy_th and angle_lr > self.slope_th:
                     self.last_transaction_price = current_price
                     self.buy(self.available_money, self.name_of_crypto)
                     self.mode = "has_to_sell"
                     if self.simulation.verbose:
-                        print("Buy action by {} on {} (slope {})".format(self.name, self.simulation.current_date, angle_lr))
+                        print("Buy action by {} on {} (slope {})".format(self.name, self.simulation.current_date,
+                                                                         angle_lr))
+
+    def _store(self, price):
+        """
+        @aim: stores a price while the memory is not full (and updates the sums)
+        @input: - price : price to store
+        """
+
+        price = self.memory.dtype.type(price)  # the sums are the ones of the stored prices (in float64)
+        self.memory[self._count] = price
+        self._y_sum += np.float64(price)
+        self._ty_sum += self._count * np.float64(price)
+        self._count += 1
+
+    def _shift(self, price):
+        """
+        @aim: replaces the oldest price of the full memory by a new one and updates the sums (window shifted by one)
+        @input: - price : price to store
+        """
+
+        price = self.memory.dtype.type(price)
+        old_price = np.float64(self.memory[self._head])
+        self.memory[self._head] = price
+        self._head = (self._head + 1) % self.memory_size
+        self._ty_sum += old_price - self._y_sum + (self.memory_size - 1) * np.float64(price)
+        self._y_sum += np.float64(price) - old_price
+        if self._head == 0:  # memory back in chronological order, recompute the sums to avoid drifting
+            self._y_sum = self.memory.sum(dtype=np.float64)
+            self._ty_sum = np.arange(self.memory_size, dtype=np.float64) @ self.memory
+
+    def _slope(self):
+        """
+        @aim: computes the least squares slope of the prices in the memory (oldest one at x=0) from the sums
+        @output: slope of the prices
+        """
+
+        return (self.memory_size * self._ty_sum - self._x_sum * self._y_sum) / self._denom
 
     def load_init_info(self):
         """
         @aim: initialise the agent by getting the first buy price
         """
 
-        self.last_transaction_price = self.simulation.market.get_price(self.name_of_crypto,
-                                                                       self.simulation.current_date)
-        self.memory.append(self.last_transaction_price)
+        self.memory = np.empty(self.memory_size, dtype=self.simulation.market.prices.dtype)
+
+        self.last_transaction_price = self.simulation.market.get_price_at_tick(self.name_of_crypto,
+                                                                               self.simulation.t_idx)
+        self._store(self.last_transaction_price)
+        self.crypto_row = self.crypto_idx[self.name_of_crypto]
+
+
+# --- Main (just to test and see how it works) --- #
+if __name__ == "__main__":
+    from scipy.stats import linregress
+
+    # Compare the rolling slope with a regression on the same float32 prices (around 50k as the BTC)
+    memory_size_test = 120
+    prices_test = (50000 + np.cumsum(np.random.default_rng(0).normal(0, 20, 5000))).astype(np.float32)
+    agent_test = SlopeEstimationAgent("Test", ["BTC"], 100, {"BTC": 1}, "BTC", 1 / 100, -0.5 / 100, 45,
+                                      memory_size_test)
+    agent_test.memory = np.empty(memory_size_test, dtype=prices_test.dtype)
+
+    max_diff = 0
+    for t, price_test in enumerate(prices_test):
+        if agent_test._count < memory_size_test:
+            agent_test._store(price_test)
+        else:
+            agent_test._shift(price_test)
+        if t >= memory_size_test - 1:
+            window_test = prices_test[t - memory_size_test + 1:t + 1].astype(np.float64)
+            lr = linregress(np.arange(memory_size_test), window_test)
+            max_diff = max(max_diff, abs(agent_test._slope() - lr.slope))
+
+    print("Max difference of the slope with linregress: {}".format(max_diff))
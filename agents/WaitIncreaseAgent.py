@@ -6,7 +6,79 @@
 """
 
 # --- Libraries, constants and parameters --- #
-from CryptoAgent import CryptoAgent
+import numpy as np
+from CryptoAgent import CryptoAgent, init_spend
+from crypto_api_numba import NUMBA_AVAILABLE, njit, prange
+
+
+# --- Kernels definition --- #
+@njit(cache=True, nogil=True)
+def pool_find_actions(crypto_rows, thresholds, ref_prices, prices_block, valid):
+    """
+    @aim: finds in one pass on a batch the steps where the agents of a pool of WaitIncreaseAgent sell and buy again
+          (the prices of a step are read once for all the agents), same decisions as WaitIncreaseAgent.step_batch
+    @input: - crypto_rows : index of the crypto of each agent in the prices
+            - thresholds : sell threshold of each agent (same dtype as the prices)
+            - ref_prices : last buy price of each agent (same dtype as the prices, updated in place at each action)
+            - prices_block : price of each crypto on each step of the batch
+            - valid : bool array, True on the steps where the agents are called
+    @output: int64 arrays with the index in the pool of the agent and the index in the batch of the step of each
+             action (in the order of the steps)
+    """
+
+    capacity = max(len(ref_prices), 1)
+    agent_pos_l = np.empty(capacity, dtype=np.int64)
+    step_l = np.empty(capacity, dtype=np.int64)
+    n_actions = 0
+    for k in range(prices_block.shape[1]):
+        if not valid[k]:
+            continue
+        for i in range(len(ref_prices)):
+            price = prices_block[crypto_rows[i], k]
+            if (price - ref_prices[i]) / ref_prices[i] > thresholds[i]:
+                if n_actions == capacity:  # more space if full
+                    capacity *= 2
+                    agent_pos_l = np.concatenate((agent_pos_l, np.empty_like(agent_pos_l)))
+                    step_l = np.concatenate((step_l, np.empty_like(step_l)))
+                agent_pos_l[n_actions] = i
+                step_l[n_actions] = k
+                n_actions += 1
+                ref_prices[i] = price
+    return agent_pos_l[:n_actions], step_l[:n_actions]
+
+
+@njit(cache=True, nogil=True, parallel=True)
+def sweep_values(prices, valid, buy_prices, sell_values, init_price, sell_th_l, init_qte, init_money):
+    """
+    @aim: runs at once several WaitIncreaseAgent that only differ by their sell threshold (one agent per thread), with
+          the same decisions and transactions as the agents stepped by the simulation
+    @input: - prices : price of the crypto on each step of the simulation
+            - valid : bool array, True on the steps where the agents are called
+            - buy_prices : price to pay for one crypto on each step (API taxes included)
+            - sell_values : money earned for one crypto on each step (API taxes included)
+            - init_price : price of the crypto on the first step (same dtype as the prices)
+            - sell_th_l : sell threshold of each agent (same dtype as the prices)
+            - init_qte, init_money : qte of the crypto and money of the agents after the initial buy
+    @output: array (n_agents, n_steps) with the money of each agent plus the value of its crypto at each step,
+             nb of actions of each agent
+    """
+
+    values = np.empty((len(sell_th_l), len(prices)), dtype=np.float64)
+    n_actions = np.zeros(len(sell_th_l), dtype=np.int64)
+    for k in prange(len(sell_th_l)):
+        last_buy_price = init_price
+        qte = init_qte
+        money = init_money
+        values[k, 0] = money + qte * sell_values[0]
+        for t in range(1, len(prices)):  # first step skipped as in the simulation
+            if valid[t] and (prices[t] - last_buy_price) / last_buy_price > sell_th_l[k]:
+                money += qte * sell_values[t]
+                qte = money / buy_prices[t]
+                money = 0.0
+                last_buy_price = prices[t]
+                n_actions[k] += 1
+            values[k, t] = money + qte * sell_values[t]
+    return values, n_actions
 
 
 # --- Class definition --- #
@@ -16,13 +88,23 @@ class WaitIncreaseAgent(CryptoAgent):
     reinvest all directly. Only works on one crypto.
     @functions: - __init__ : initialise the agent
                 - step : check if the percentage of increase is interesting enough, if yes sells and buys again
+                - vector_step : same as step but uses the prices gathered by the simulation
+                - step_batch : same as vector_step on a batch of steps at once
+                - check_increase : sells and buys again if the price increased more than the threshold
+                - sell_buy : sells everything and buys again directly
                 - load_init_info : get the initial price of the crypto
+                - pool_params : parameters used by the pool_batch_kernel to decide for this agent
+                - pool_act : makes the action decided by the pool_batch_kernel for this agent
+                - sweep : simulate at once agents that only differ by their sell threshold
                 - others : see the parent class
     @parameters:- name_of_crypto : name of the crypto to consider (only works on one)
                 - sell_th : sell threshold (in perc) to sell the crypto
+                - crypto_row : index of the crypto in the prices of the simulation
                 - others : see the parent class
     """
 
+    pool_batch_kernel = staticmethod(pool_find_actions) if NUMBA_AVAILABLE else None  # python loop too slow
+
     def __init__(self, name, crypto_name_l, init_money, init_repartition, name_of_crypto, sell_th):
         """
         @aim: initialise the agent
@@ -35,27 +117,123 @@ class WaitIncreaseAgent(CryptoAgent):
         self.name_of_crypto = name_of_crypto
         self.sell_th = sell_th
         self.last_buy_price = None
+        self.crypto_row = None
 
     def step(self):
         """
         @aim: the agent sells everything if the value augmented more than the threshold, and buys again all directly
         """
 
-        # Get the price and compute the difference
-        current_price = self.simulation.market.get_price(self.name_of_crypto, self.simulation.current_date)
+        current_price = self.simulation.market.get_price_at_tick(self.name_of_crypto, self.simulation.t_idx)
+        self.check_increase(current_price)
+
+    def vector_step(self, t_idx, prices_row):
+        """
+        @aim: same as step but the price is read from the prices gathered by the simulation
+        @input: - t_idx : index of the step in the simulation
+                - prices_row : price of each crypto of the simulation at this step
+        """
+
+        self.check_increase(prices_row[self.crypto_row])
+
+    def step_batch(self, t_start, t_end, prices_block, valid):
+        """
+        @aim: same as vector_step on a batch of steps: looks for the first step of the batch where the price increased
+              more than the threshold (on all the steps at once), acts there and looks again from the next step
+              (with numba the agents are grouped in an AgentPool instead, that decides with pool_find_actions)
+        @input: - t_start : index of the first step of the batch in the simulation
+                - t_end : index of the step after the last one of the batch
+                - prices_block : price of each crypto on each step of the batch (n_crypto, t_end - t_start)
+                - valid : bool array, True on the steps of the batch where all the prices are available
+        """
+
+        valid_idx = np.flatnonzero(valid)
+        prices = prices_block[self.crypto_row, valid_idx]
+        pos = 0
+        while pos < len(prices):
+            # the reference changes with each action -> only the first hit is valid, search again after it
+            hit_l = np.flatnonzero((prices[pos:] - self.last_buy_price) / self.last_buy_price > self.sell_th)
+            if len(hit_l) == 0:
+                break
+            pos += hit_l[0]
+            self.sell_buy(prices[pos], t_start + valid_idx[pos])
+            pos += 1
+
+    def check_increase(self, current_price):
+        """
+        @aim: sells everything and buys again if the price increased more than the threshold since the last buy
+        @input: - current_price : price of the crypto at this step
+        """
+
+        # Compute the difference
         perc_diff = (current_price - self.last_buy_price) / self.last_buy_price
 
         # if it increased sell and buy again
         if perc_diff > self.sell_th:
-            if self.simulation.verbose:
-                print("Sell-Buy action by {} on {}".format(self.name, self.simulation.current_date))
-            self.sell(self.available_crypto_l[self.name_of_crypto], self.name_of_crypto)
-            self.buy(self.available_money, self.name_of_crypto)
-            self.last_buy_price = current_price
+            self.sell_buy(current_price)
+
+    def sell_buy(self, current_price, t_idx=None):
+        """
+        @aim: sells everything and buys again directly (the price becomes the new reference)
+        @input: - current_price : price of the crypto at the step of the action
+                - t_idx : index of the step of the action (None for the current step of the simulation)
+        """
+
+        if self.simulation.verbose:
+            print("Sell-Buy action by {} on {}".format(self.name, self._step_date(t_idx)))
+        self.sell(self.holdings[self.crypto_row], self.name_of_crypto, t_idx)
+        self.buy(self.available_money, self.name_of_crypto, t_idx)
+        self.last_buy_price = current_price
 
     def load_init_info(self):
         """
         @aim: initialise the agent by getting the first buy price
         """
 
-        self.last_buy_price = self.simulation.market.get_price(self.name_of_crypto, self.simulation.current_date)
+        self.last_buy_price = self.simulation.market.get_price_at_tick(self.name_of_crypto, self.simulation.t_idx)
+        self.crypto_row = self.crypto_idx[self.name_of_crypto]
+
+    def pool_params(self):
+        """
+        @aim: give the parameters used by the pool_batch_kernel to decide for this agent
+        @output: index of the crypto in the prices, sell threshold, last buy price
+        """
+
+        return self.crypto_row, self.sell_th, self.last_buy_price
+
+    def pool_act(self, current_price, t_idx):
+        """
+        @aim: makes the action decided by the pool_batch_kernel for this agent (sells everything and buys again)
+        @input: - current_price : price of the crypto at the step of the action
+                - t_idx : index of the step of the action
+        """
+
+        self.sell_buy(current_price, t_idx)
+
+    @classmethod
+    def sweep(cls, simulation, init_money, init_repartition, name_of_crypto, sell_th):
+        """
+        @aim: simulate at once agents that only differ by their sell threshold (see CryptoSimulation.simulate_batch)
+        @input: - simulation : simulation giving the prices (its agents are not used)
+                - sell_th : array with the sell threshold of each agent
+                - others : see __init__ (shared by all the agents)
+        @output: array (n_agents, n_steps) with the total value of each agent at each step (NaN if a price is
+                 missing), nb of actions (sell and buy again) of each agent
+        """
+
+        # Initial buy of all the cryptos at the first step (as buy_init_cryptos), only the one of the agent changes
+        row = simulation.crypto_idx[name_of_crypto]
+        api = simulation.api
+        spend, money_left = init_spend(cls.__name__, init_money, init_repartition, simulation.crypto_name_l)
+        bought_mask = spend > 0
+        init_holdings = np.zeros(len(spend), dtype=np.float64)
+        np.divide(spend, api.buy_price[:, 0], out=init_holdings, where=bought_mask)
+        # value of the other cryptos held (the ones not held do not count, even where their price is missing)
+        other_rows = bought_mask & (np.arange(len(spend)) != row)
+        other_values = init_holdings[other_rows] @ api.sell_value[other_rows]
+
+        prices = simulation.market.prices[row]
+        valid = ~np.isnan(simulation.market.prices).any(axis=0)
+        values, n_actions = sweep_values(prices, valid, api.buy_price[row], api.sell_value[row], prices[0],
+                                         np.asarray(sell_th, dtype=prices.dtype), init_holdings[row], money_left)
+        return values + other_values, n_actions
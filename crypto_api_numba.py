@@ -0,0 +1,63 @@
+"""
+@aim: Implements the arithmetic of the API transactions as compiled kernels (used by the agents on each buy/sell)
+Numba is optional: if it is not installed the kernels run as plain python functions
+@authors: Ivan-Daniel Sievering
+@date: 2022/01/31
+"""
+
+# --- Libraries, constants and parameters --- #
+# Libraries
+try:
+    from numba import njit, prange
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+    prange = range
+
+    def njit(*args, **kwargs):
+        """
+        @aim: replaces numba.njit when numba is not installed (returns the function unchanged)
+        """
+
+        if len(args) == 1 and callable(args[0]):
+            return args[0]
+        return lambda func: func
+
+
+# --- Kernels definition --- #
+@njit(cache=True, nogil=True, fastmath=True)
+def apply_buy(holdings, money_avail, idx, money, buy_price):
+    """
+    @aim: buy for a certain amount of money of a crypto (updates the holdings in place)
+          the money is clamped to the money available (no branch, the caller checks the request if needed)
+    @input: - holdings : array of the qte of each crypto that the agent has
+            - money_avail : money that the agent has
+            - idx : index of the crypto in the holdings
+            - money : quantity of money to invest
+            - buy_price : price to pay for one crypto (API taxes included)
+    @output: money left to the agent, quantity of crypto bought
+    """
+
+    money = min(money, money_avail)
+    crypto_qte = money / buy_price
+    holdings[idx] += crypto_qte
+    return money_avail - money, crypto_qte
+
+
+@njit(cache=True, nogil=True, fastmath=True)
+def apply_sell(holdings, money_avail, idx, crypto_qte, sell_value):
+    """
+    @aim: sell a certain amount of a crypto (updates the holdings in place)
+          the qte is clamped to the qte available (no branch, the caller checks the request if needed)
+    @input: - holdings : array of the qte of each crypto that the agent has
+            - money_avail : money that the agent has
+            - idx : index of the crypto in the holdings
+            - crypto_qte : quantity of crypto to sell
+            - sell_value : money earned for one crypto (API taxes included)
+    @output: money of the agent after the sell, money earned with the sell
+    """
+
+    crypto_qte = min(crypto_qte, holdings[idx])
+    money = crypto_qte * sell_value
+    holdings[idx] -= crypto_qte
+    return money_avail + money, money
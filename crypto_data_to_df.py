@@ -3,7 +3,7 @@
 Expecting data minute by minute from https://www.cryptodatadownload.com/data/binance/
 They give headers:
 unix	date	symbol	open	high	low	close	Volume BTC	Volume USDT	trade-count
-We return a .csv with the header (date as Y-m-d H:M:S) and value at opening:
+We return a .parquet (zstd compressed) with the date (stored as a date) and the value at opening (float32):
 date value
 @authors: Ivan-Daniel Sievering
 @date: 2022/01/31
@@ -12,6 +12,7 @@ date value
 # --- Libraries, constants and parameters --- #
 # Libraries
 import os
+import numpy as np
 import pandas as pd
 
 # Constants
@@ -20,7 +21,7 @@ TREATED_DATA_FOLDER = "crypto_df"  # name of the folder where to save the new da
 
 # Parameters
 filename = "Binance_BTCUSDT_minute.csv"  # original file
-target_filename = "BTC_USD.csv"  # name of the new file, has to be crypto_money.csv
+target_filename = "BTC_USD.parquet"  # name of the new file, has to be crypto_money.parquet
 
 # --- Main --- #
 if __name__ == "__main__":
@@ -32,12 +33,13 @@ if __name__ == "__main__":
     df = df.drop(columns=["unix", "symbol", "high", "low", "close", "tradecount"])
     df = df.rename(columns={"open": "value"})
     df["date"] = pd.to_datetime(df["date"])
+    df["value"] = df["value"].astype(np.float32)  # precision of the prices in the simulation
     df = df.drop(df.columns[-1], axis=1)
     df = df.drop(df.columns[-1], axis=1)
 
     # Save the file
-    df.to_csv(os.path.join(TREATED_DATA_FOLDER, target_filename), index=False)
+    df.to_parquet(os.path.join(TREATED_DATA_FOLDER, target_filename), compression="zstd", index=False)
 
     # Check the file
-    df = pd.read_csv(os.path.join(TREATED_DATA_FOLDER, target_filename))
+    df = pd.read_parquet(os.path.join(TREATED_DATA_FOLDER, target_filename))
     print(df.sample(5))
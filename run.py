@@ -6,6 +6,7 @@
 
 # --- Libraries, constants and parameters --- #
 # Libraries
+import logging
 import pandas as pd
 from CryptoSimulation import CryptoSimulation
 from agents.SleepingAgent import SleepingAgent
@@ -27,6 +28,9 @@ agent_list = [
 
 # --- Main --- #
 if __name__ == "__main__":
+    # Display the information messages of the market/API
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
     # Create the simulation
     simulation = CryptoSimulation(init_date, end_date, crypto_list, frequency=frequency)
 
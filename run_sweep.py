@@ -0,0 +1,53 @@
+"""
+@aim: Code to run at once many WaitIncreaseAgent with different sell thresholds in the market (parameter sweep)
+@authors: Ivan-Daniel Sievering
+@date: 2022/01/31
+"""
+
+# --- Libraries, constants and parameters --- #
+# Libraries
+import logging
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+from CryptoSimulation import CryptoSimulation
+from agents.WaitIncreaseAgent import WaitIncreaseAgent
+
+# Parameters
+init_date = pd.to_datetime("2020-01-01 00:00:00")  # start one step before
+end_date = pd.to_datetime("2021-01-01 00:00:00")  # stops one step before
+crypto_list = ["BTC"]
+frequency = 60 * 1 * 1  # in seconds
+
+# Agents (one per sell threshold)
+init_money = 100
+init_repartition = {"BTC": 1.0}
+sell_th_l = np.linspace(0.5 / 100, 5 / 100, 100)
+
+# --- Main --- #
+if __name__ == "__main__":
+    # Display the information messages of the market/API
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    # Create the simulation (the agents are not added, they are all run at once on its prices)
+    simulation = CryptoSimulation(init_date, end_date, crypto_list, frequency=frequency)
+
+    # Run the agents
+    values, n_actions = simulation.simulate_batch(WaitIncreaseAgent, init_money, init_repartition,
+                                                  {"name_of_crypto": "BTC", "sell_th": sell_th_l})
+
+    # Evaluate them
+    best = np.nanargmax(values[:, -1])
+    print("Best sell threshold: {:.3%} ({} actions, final value {})".format(sell_th_l[best], n_actions[best],
+                                                                           values[best, -1]))
+
+    sweep_fig, sweep_axs = plt.subplots(2)
+    sweep_fig.suptitle("Sweep of the sell threshold of WaitIncreaseAgent")
+    sweep_axs[0].plot(sell_th_l * 100, values[:, -1])
+    sweep_axs[0].set_xlabel("Sell threshold (%)")
+    sweep_axs[0].set_ylabel("Final value in {}".format(simulation.currency))
+    sweep_axs[1].plot(simulation.date_grid, values[best])
+    sweep_axs[1].set_title("Best agent")
+    sweep_axs[1].set_xlabel("Date")
+    sweep_axs[1].set_ylabel("Value in {}".format(simulation.currency))
+    plt.show()